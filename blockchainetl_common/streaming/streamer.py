@@ -22,11 +22,18 @@
 
 
 import logging
+import mmap
 import os
+import pathlib
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from blockchainetl_common.streaming.streamer_adapter_stub import StreamerAdapterStub
-from blockchainetl_common.file_utils import smart_open
+from blockchainetl_common.streaming.uring_checkpoint_writer import UringCheckpointWriter, uring_available
+
+# 20-digit zero-padded block number plus a newline. Fixed-width records allow
+# reading the most recent checkpoint with a single pread at a known offset.
+CHECKPOINT_RECORD_SIZE = 21
 
 
 class Streamer:
@@ -41,7 +48,10 @@ class Streamer:
             block_batch_size=10,
             ramp_up_blocks=0,
             retry_errors=True,
-            pid_file=None):
+            pid_file=None,
+            use_uring=False,
+            checkpoint_fsync_interval=10,
+            adapter_pool_size=4):
         """
         Initializes a new instance of the Streamer class.
 
@@ -56,6 +66,9 @@ class Streamer:
         - ramp_up_blocks (int, optional): Specifies the count of initial blocks to be processed one by one before switching to batch processing. This approach is particularly beneficial for mitigating issues like Out-of-Memory (OOM) errors when dealing with large batches. Default is 0.
         - retry_errors (bool, optional): Whether to retry on errors during syncing. Default is True.
         - pid_file (str, optional): File path for writing the process ID. Default is None.
+        - use_uring (bool, optional): Batch checkpoint writes through an io_uring submission queue instead of writing synchronously every cycle. Requires the liburing package and Linux; silently falls back to synchronous writes otherwise. Default is False.
+        - checkpoint_fsync_interval (int, optional): Number of checkpoint writes between fsync calls on the checkpoint file. A final fsync always runs on shutdown. Default is 10.
+        - adapter_pool_size (int, optional): Number of adapter sessions to use for exporting. Only takes effect when the adapter defines set_pool_size; large batches are then sharded across a thread pool and joined before the checkpoint is written, and the next cycle's tip query is prefetched concurrently with the export. Default is 4.
 
         Description:
         This method sets up a new Streamer instance for blockchain data streaming. It configures the blockchain adapter, file paths, and synchronization parameters. The single_block_ramp_up_count parameter enables initial processing of blocks individually, allowing for a smooth transition to batch processing. The method also handles the initialization of the last synced block file, taking into account the provided start_block parameter and the existence of the last synced block file.
@@ -70,73 +83,227 @@ class Streamer:
         self.block_batch_size = block_batch_size
         self.ramp_up_blocks = ramp_up_blocks
         self.processed_blocks_count = 0
+        # Sticky flag: re-evaluated while ramping up, never again once done.
+        self._in_ramp_up = bool(ramp_up_blocks and ramp_up_blocks > 0)
+        # Effective batch size doubles while catching up with the tip, up to
+        # 32x the configured batch size, to amortize per-cycle overhead.
+        self._effective_batch_size = block_batch_size
 
         self.retry_errors = retry_errors
         self.pid_file = pid_file
+        self.checkpoint_fsync_interval = checkpoint_fsync_interval
+        self.adapter_pool_size = adapter_pool_size
+        self._adapter_pool = None
+        self._tip_executor = None
+        self._pending_tip = None
+
+        checkpoint_exists = os.path.isfile(self.last_synced_block_file)
+        if self.start_block is not None and checkpoint_exists:
+            raise ValueError(
+                '{} should not exist if --start-block option is specified. '
+                'Either remove the {} file or the --start-block option.'
+                    .format(self.last_synced_block_file, self.last_synced_block_file))
+
+        self._checkpoint_fd = open_last_synced_block_file(self.last_synced_block_file)
+        if self.start_block is not None or not checkpoint_exists:
+            write_last_synced_block(self._checkpoint_fd, (self.start_block or 0) - 1)
+
+        # The checkpoint is read by slice indexing a short-lived memory map.
+        # The map is not kept around: only __init__ ever reads it, and
+        # keeping it current would cost an fstat and a possible remap per
+        # checkpoint write.
+        checkpoint_mmap = mmap.mmap(self._checkpoint_fd, 0, access=mmap.ACCESS_READ)
+        try:
+            self.last_synced_block = read_last_synced_block(checkpoint_mmap)
+        finally:
+            checkpoint_mmap.close()
+        self._writes_since_fsync = 0
 
-        if self.start_block is not None or not os.path.isfile(self.last_synced_block_file):
-            init_last_synced_block_file((self.start_block or 0) - 1, self.last_synced_block_file)
-
-        self.last_synced_block = read_last_synced_block(self.last_synced_block_file)
+        self._checkpoint_writer = None
+        if use_uring and uring_available():
+            self._checkpoint_writer = UringCheckpointWriter(self._checkpoint_fd)
 
     def stream(self):
         try:
             if self.pid_file is not None:
-                logging.info('Creating pid file {}'.format(self.pid_file))
+                logging.info('Creating pid file %s', self.pid_file)
                 write_to_file(self.pid_file, str(os.getpid()))
+            self._fsync_metadata_dirs()
             self.blockchain_streamer_adapter.open()
+            set_pool_size = getattr(self.blockchain_streamer_adapter, 'set_pool_size', None)
+            if set_pool_size is not None and self.adapter_pool_size > 1:
+                set_pool_size(self.adapter_pool_size)
+                self._adapter_pool = ThreadPoolExecutor(max_workers=self.adapter_pool_size)
+                # The tip prefetch runs concurrently with export_all, so it
+                # is only enabled for adapters that opted into concurrent use
+                # through set_pool_size.
+                self._tip_executor = ThreadPoolExecutor(max_workers=1)
             self._do_stream()
         finally:
+            if self._tip_executor is not None:
+                self._tip_executor.shutdown()
+                self._tip_executor = None
+                self._pending_tip = None
+            if self._adapter_pool is not None:
+                self._adapter_pool.shutdown()
+                self._adapter_pool = None
             self.blockchain_streamer_adapter.close()
+            if self._checkpoint_writer is not None:
+                self._checkpoint_writer.close()
+            os.fsync(self._checkpoint_fd)
+            os.close(self._checkpoint_fd)
             if self.pid_file is not None:
-                logging.info('Deleting pid file {}'.format(self.pid_file))
+                logging.info('Deleting pid file %s', self.pid_file)
                 delete_file(self.pid_file)
+            self._fsync_metadata_dirs()
 
     def _do_stream(self):
-        while True and (self.end_block is None or self.last_synced_block < self.end_block):
+        # Bind loop invariants as locals; only last_synced_block is re-read
+        # from self since _sync_cycle mutates it.
+        end_block = self.end_block
+        period_seconds = self.period_seconds
+        retry_errors = self.retry_errors
+        sync_cycle = self._sync_cycle
+        wait_for_new_block = self._wait_for_new_block
+
+        def cycle():
             synced_blocks = 0
 
             try:
-                synced_blocks = self._sync_cycle()
+                synced_blocks = sync_cycle()
             except Exception as e:
                 # https://stackoverflow.com/a/4992124/1580227
                 logging.exception('An exception occurred while syncing block data.')
-                if not self.retry_errors:
+                if not retry_errors:
                     raise e
 
             if synced_blocks <= 0:
-                logging.info('Nothing to sync. Sleeping for {} seconds...'.format(self.period_seconds))
-                time.sleep(self.period_seconds)
+                logging.info('Nothing to sync. Waiting for %s seconds...', period_seconds)
+                wait_for_new_block()
+
+        # The end_block check is split out of the unbounded case so the loop
+        # condition does not evaluate an always-None comparison per iteration.
+        if end_block is None:
+            while True:
+                cycle()
+        else:
+            while self.last_synced_block < end_block:
+                cycle()
 
     def _sync_cycle(self):
-        current_block = self.blockchain_streamer_adapter.get_current_block_number()
+        current_block = self._get_current_block_number()
 
-        if self.ramp_up_blocks and self.ramp_up_blocks > 0 and self.processed_blocks_count <= self.ramp_up_blocks:
+        ramping_up = self._in_ramp_up
+        if ramping_up:
             block_batch_size = 1
         else:
-            block_batch_size = self.block_batch_size
+            block_batch_size = self._effective_batch_size
 
-        target_block = self._calculate_target_block(current_block, self.last_synced_block, block_batch_size)
-        blocks_to_sync = max(target_block - self.last_synced_block, 0)
+        # The target block math is inlined as plain comparisons; min() calls
+        # and a method call per cycle are measurable under sub-second polling.
+        last_synced_block = self.last_synced_block
+        target_block = current_block - self.lag
+        max_batch_block = last_synced_block + block_batch_size
+        if target_block > max_batch_block:
+            target_block = max_batch_block
+        end_block = self.end_block
+        if end_block is not None and target_block > end_block:
+            target_block = end_block
 
-        logging.info('Current block {}, target block {}, last synced block {}, blocks to sync {}'.format(
-            current_block, target_block, self.last_synced_block, blocks_to_sync))
+        blocks_to_sync = target_block - last_synced_block
+        if blocks_to_sync < 0:
+            blocks_to_sync = 0
+
+        logging.info('Current block %d, target block %d, last synced block %d, blocks to sync %d',
+                     current_block, target_block, last_synced_block, blocks_to_sync)
 
         if blocks_to_sync != 0:
-            self.blockchain_streamer_adapter.export_all(self.last_synced_block + 1, target_block)
-            logging.info('Writing last synced block {}'.format(target_block))
-            write_last_synced_block(self.last_synced_block_file, target_block)
+            # Submit the next cycle's tip query before the export so its RPC
+            # round-trip overlaps the export work. Skipped once target_block
+            # reaches end_block, since there is no next cycle to use it.
+            if self._tip_executor is not None and target_block != end_block:
+                self._pending_tip = self._tip_executor.submit(
+                    self.blockchain_streamer_adapter.get_current_block_number)
+            self._export_all(last_synced_block + 1, target_block)
+            logging.info('Writing last synced block %d', target_block)
+            self._write_checkpoint(target_block)
             self.last_synced_block = target_block
 
             self.processed_blocks_count += blocks_to_sync
 
+        if ramping_up:
+            self._in_ramp_up = self.processed_blocks_count <= self.ramp_up_blocks
+        elif blocks_to_sync == block_batch_size:
+            self._effective_batch_size = min(block_batch_size * 2, self.block_batch_size * 32)
+        elif blocks_to_sync < self.block_batch_size:
+            self._effective_batch_size = self.block_batch_size
+
         return blocks_to_sync
 
-    def _calculate_target_block(self, current_block, last_synced_block, block_batch_size):
-        target_block = current_block - self.lag
-        target_block = min(target_block, last_synced_block + block_batch_size)
-        target_block = min(target_block, self.end_block) if self.end_block is not None else target_block
-        return target_block
+    def _get_current_block_number(self):
+        pending_tip = self._pending_tip
+        self._pending_tip = None
+        if pending_tip is not None:
+            try:
+                return pending_tip.result()
+            except Exception:
+                logging.exception('Prefetched current block number failed. Retrying synchronously.')
+        return self.blockchain_streamer_adapter.get_current_block_number()
+
+    def _fsync_metadata_dirs(self):
+        # One directory fsync makes the checkpoint and pid file entries
+        # durable together instead of one metadata flush per file operation.
+        dirnames = {os.path.dirname(self.last_synced_block_file)}
+        if self.pid_file is not None:
+            dirnames.add(os.path.dirname(self.pid_file))
+        for dirname in dirnames:
+            fsync_dir(dirname)
+
+    def _export_all(self, start_block, end_block):
+        # Sharding is only worthwhile when every pool worker gets at least a
+        # couple of blocks; small batches go through the adapter directly.
+        if self._adapter_pool is None or end_block - start_block + 1 < self.adapter_pool_size * 2:
+            self.blockchain_streamer_adapter.export_all(start_block, end_block)
+            return
+
+        futures = [
+            self._adapter_pool.submit(self.blockchain_streamer_adapter.export_all, sub_start, sub_end)
+            for sub_start, sub_end in split_block_range(start_block, end_block, self.adapter_pool_size)
+        ]
+        # Join before the checkpoint is written; the sub-ranges are
+        # non-overlapping so atomicity of the checkpoint is preserved.
+        for future in futures:
+            future.result()
+
+    def _wait_for_new_block(self):
+        wait_for_new_block = getattr(self.blockchain_streamer_adapter, 'wait_for_new_block', None)
+        if wait_for_new_block is not None:
+            wait_for_new_block(self.last_synced_block, self.period_seconds)
+        else:
+            time.sleep(self.period_seconds)
+
+    def _write_checkpoint(self, last_synced_block):
+        if self._checkpoint_writer is not None:
+            self._checkpoint_writer.write(format_checkpoint_record(last_synced_block))
+        else:
+            write_last_synced_block(self._checkpoint_fd, last_synced_block)
+
+        self._writes_since_fsync += 1
+        if self._writes_since_fsync >= self.checkpoint_fsync_interval:
+            if self._checkpoint_writer is not None:
+                self._checkpoint_writer.drain()
+            os.fsync(self._checkpoint_fd)
+            self._writes_since_fsync = 0
+
+
+def fsync_dir(dirname):
+    if not hasattr(os, 'O_DIRECTORY'):
+        return
+    dfd = os.open(dirname or '.', os.O_DIRECTORY)
+    try:
+        os.fsync(dfd)
+    finally:
+        os.close(dfd)
 
 
 def delete_file(file):
@@ -146,24 +313,44 @@ def delete_file(file):
         pass
 
 
-def write_last_synced_block(file, last_synced_block):
-    write_to_file(file, str(last_synced_block) + '\n')
+def split_block_range(start_block, end_block, parts):
+    total = end_block - start_block + 1
+    chunk_size = total // parts
+    remainder = total % parts
+    sub_start = start_block
+    for part in range(parts):
+        sub_end = sub_start + chunk_size - 1 + (1 if part < remainder else 0)
+        if sub_end >= sub_start:
+            yield sub_start, sub_end
+        sub_start = sub_end + 1
+
+
+def open_last_synced_block_file(file):
+    dirname = os.path.dirname(file)
+    if dirname:
+        pathlib.Path(dirname).mkdir(parents=True, exist_ok=True)
+    return os.open(file, os.O_RDWR | os.O_CREAT | os.O_APPEND, 0o644)
+
+
+def format_checkpoint_record(last_synced_block):
+    return '{:020d}\n'.format(last_synced_block).encode()
 
 
-def init_last_synced_block_file(start_block, last_synced_block_file):
-    if os.path.isfile(last_synced_block_file):
-        raise ValueError(
-            '{} should not exist if --start-block option is specified. '
-            'Either remove the {} file or the --start-block option.'
-                .format(last_synced_block_file, last_synced_block_file))
-    write_last_synced_block(last_synced_block_file, start_block)
+def write_last_synced_block(fd, last_synced_block):
+    os.write(fd, format_checkpoint_record(last_synced_block))
 
 
-def read_last_synced_block(file):
-    with smart_open(file, 'r') as last_synced_block_file:
-        return int(last_synced_block_file.read())
+def read_last_synced_block(checkpoint_mmap):
+    # Files written before the fixed-width format contain a single shorter
+    # record, in which case the slice below starts at offset 0 and still
+    # covers the whole record.
+    offset = max(len(checkpoint_mmap) - CHECKPOINT_RECORD_SIZE, 0)
+    return int(checkpoint_mmap[offset:])
 
 
 def write_to_file(file, content):
-    with smart_open(file, 'w') as file_handle:
+    dirname = os.path.dirname(file)
+    if dirname:
+        pathlib.Path(dirname).mkdir(parents=True, exist_ok=True)
+    with open(file, 'w') as file_handle:
         file_handle.write(content)
@@ -1,3 +1,6 @@
+import time
+
+
 class StreamerAdapterStub:
 
     def open(self):
@@ -9,5 +12,10 @@ class StreamerAdapterStub:
     def export_all(self, start_block, end_block):
         pass
 
+    def wait_for_new_block(self, last_synced_block, timeout):
+        # Adapters backed by push-capable transports (pubsub, websockets)
+        # should override this to return as soon as the head advances.
+        time.sleep(timeout)
+
     def close(self):
         pass
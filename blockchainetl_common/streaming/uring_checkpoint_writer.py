@@ -0,0 +1,104 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+
+import fcntl
+import os
+import sys
+
+try:
+    import liburing
+except ImportError:
+    liburing = None
+
+
+def uring_available():
+    return liburing is not None and sys.platform == 'linux'
+
+
+class UringCheckpointWriter:
+    """Batches fixed-width checkpoint records through an io_uring submission
+    queue so the streaming loop is not blocked on writeback latency.
+    Records are enqueued per cycle, submitted to the kernel once every
+    submit_every writes and completions are reaped on drain()/close()."""
+
+    def __init__(self, fd, submit_every=8, queue_depth=64):
+        if not uring_available():
+            raise EnvironmentError('liburing is not available on this platform')
+        self.fd = fd
+        self.submit_every = submit_every
+        self.queue_depth = queue_depth
+        # Linux ignores the supplied offset on O_APPEND descriptors, which
+        # would let in-flight writes land out of order. Clear the flag; the
+        # explicit offsets tracked below make write order irrelevant.
+        flags = fcntl.fcntl(fd, fcntl.F_GETFL)
+        fcntl.fcntl(fd, fcntl.F_SETFL, flags & ~os.O_APPEND)
+        self.ring = liburing.io_uring()
+        liburing.io_uring_queue_init(queue_depth, self.ring)
+        self._offset = os.fstat(fd).st_size
+        self._pending_buffers = []
+        self._unsubmitted = 0
+        self._in_flight = 0
+
+    def write(self, record):
+        # Completions are only reaped on drain; do so before the in-flight
+        # count can overflow the completion queue.
+        if self._unsubmitted + self._in_flight >= self.queue_depth:
+            self.drain()
+        buffer = bytearray(record)
+        sqe = liburing.io_uring_get_sqe(self.ring)
+        liburing.io_uring_prep_write(sqe, self.fd, buffer, len(buffer), self._offset)
+        # Carry the expected length so drain() can detect short writes.
+        liburing.io_uring_sqe_set_data64(sqe, len(buffer))
+        self._offset += len(buffer)
+        # Keep a reference so the buffer is not garbage collected before the
+        # kernel has consumed it.
+        self._pending_buffers.append(buffer)
+        self._unsubmitted += 1
+        if self._unsubmitted >= self.submit_every:
+            self.submit()
+
+    def submit(self):
+        if self._unsubmitted > 0:
+            self._in_flight += liburing.io_uring_submit(self.ring)
+            self._unsubmitted = 0
+
+    def drain(self):
+        self.submit()
+        cqe = liburing.io_uring_cqe()
+        while self._in_flight > 0:
+            liburing.io_uring_wait_cqe(self.ring, cqe)
+            written = liburing.trap_error(cqe.res)
+            expected = cqe.user_data
+            liburing.io_uring_cqe_seen(self.ring, cqe)
+            self._in_flight -= 1
+            if written != expected:
+                # A short write breaks the fixed-width record framing the
+                # restart read depends on, so fail loudly rather than leave a
+                # checkpoint file the streamer cannot parse.
+                raise OSError(
+                    'Short checkpoint write: {} of {} bytes'.format(written, expected))
+        self._pending_buffers.clear()
+
+    def close(self):
+        self.drain()
+        liburing.io_uring_queue_exit(self.ring)
@@ -37,6 +37,9 @@ setup(
             'timeout-decorator==0.4.1',
             'google-cloud-pubsub==2.1.0',
             'google-cloud-storage==1.33.0',
+        ],
+        'uring': [
+            'liburing==2026.3.30',
         ]
     },
     project_urls={
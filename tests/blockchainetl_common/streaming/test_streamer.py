@@ -0,0 +1,158 @@
+# MIT License
+#
+# Copyright (c) 2018 Evgeny Medvedev, evge.medvedev@gmail.com
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+import pytest
+
+from blockchainetl_common.streaming.streamer import Streamer, split_block_range
+from blockchainetl_common.streaming.streamer_adapter_stub import StreamerAdapterStub
+
+
+class MockStreamerAdapter(StreamerAdapterStub):
+    def __init__(self, current_block):
+        self.current_block = current_block
+        self.exported_ranges = []
+        self.tip_queries = 0
+
+    def get_current_block_number(self):
+        self.tip_queries += 1
+        return self.current_block
+
+    def export_all(self, start_block, end_block):
+        self.exported_ranges.append((start_block, end_block))
+
+
+def test_streamer_syncs_to_end_block(tmpdir):
+    last_synced_block_file = str(tmpdir.join('last_synced_block.txt'))
+    adapter = MockStreamerAdapter(current_block=100)
+    streamer = Streamer(
+        blockchain_streamer_adapter=adapter,
+        last_synced_block_file=last_synced_block_file,
+        start_block=0,
+        end_block=25,
+        block_batch_size=10)
+    streamer.stream()
+
+    assert adapter.exported_ranges == [(0, 9), (10, 25)]
+    assert streamer.last_synced_block == 25
+
+
+def test_streamer_resumes_from_last_synced_block(tmpdir):
+    last_synced_block_file = str(tmpdir.join('last_synced_block.txt'))
+    adapter = MockStreamerAdapter(current_block=100)
+    streamer = Streamer(
+        blockchain_streamer_adapter=adapter,
+        last_synced_block_file=last_synced_block_file,
+        start_block=0,
+        end_block=25,
+        block_batch_size=10)
+    streamer.stream()
+
+    resumed_adapter = MockStreamerAdapter(current_block=100)
+    resumed_streamer = Streamer(
+        blockchain_streamer_adapter=resumed_adapter,
+        last_synced_block_file=last_synced_block_file,
+        end_block=30,
+        block_batch_size=10)
+    resumed_streamer.stream()
+
+    assert resumed_adapter.exported_ranges == [(26, 30)]
+    assert resumed_streamer.last_synced_block == 30
+
+
+def test_streamer_grows_batch_size_while_catching_up(tmpdir):
+    last_synced_block_file = str(tmpdir.join('last_synced_block.txt'))
+    adapter = MockStreamerAdapter(current_block=10000)
+    streamer = Streamer(
+        blockchain_streamer_adapter=adapter,
+        last_synced_block_file=last_synced_block_file,
+        start_block=0,
+        end_block=1000,
+        block_batch_size=10)
+    streamer.stream()
+
+    # Batch size doubles after every full batch, capped at 32x.
+    assert adapter.exported_ranges[:5] == [(0, 9), (10, 29), (30, 69), (70, 149), (150, 309)]
+    assert max(end - start + 1 for start, end in adapter.exported_ranges) <= 10 * 32
+    assert streamer.last_synced_block == 1000
+
+
+def test_streamer_ramps_up_block_by_block(tmpdir):
+    last_synced_block_file = str(tmpdir.join('last_synced_block.txt'))
+    adapter = MockStreamerAdapter(current_block=100)
+    streamer = Streamer(
+        blockchain_streamer_adapter=adapter,
+        last_synced_block_file=last_synced_block_file,
+        start_block=0,
+        end_block=10,
+        block_batch_size=5,
+        ramp_up_blocks=3)
+    streamer.stream()
+
+    assert adapter.exported_ranges == [(0, 0), (1, 1), (2, 2), (3, 3), (4, 8), (9, 10)]
+    assert streamer.last_synced_block == 10
+
+
+class MockPooledStreamerAdapter(MockStreamerAdapter):
+    def __init__(self, current_block):
+        super().__init__(current_block)
+        self.pool_size = None
+
+    def set_pool_size(self, pool_size):
+        self.pool_size = pool_size
+
+
+def test_streamer_shards_export_across_adapter_pool(tmpdir):
+    last_synced_block_file = str(tmpdir.join('last_synced_block.txt'))
+    adapter = MockPooledStreamerAdapter(current_block=100)
+    streamer = Streamer(
+        blockchain_streamer_adapter=adapter,
+        last_synced_block_file=last_synced_block_file,
+        start_block=0,
+        end_block=19,
+        block_batch_size=20,
+        adapter_pool_size=4)
+    streamer.stream()
+
+    assert adapter.pool_size == 4
+    assert sorted(adapter.exported_ranges) == [(0, 4), (5, 9), (10, 14), (15, 19)]
+    assert streamer.last_synced_block == 19
+    # The cycle that reaches end_block must not prefetch a tip it never uses.
+    assert adapter.tip_queries == 1
+
+
+@pytest.mark.parametrize('start_block, end_block, parts, expected_ranges', [
+    (0, 19, 4, [(0, 4), (5, 9), (10, 14), (15, 19)]),
+    (1, 10, 3, [(1, 4), (5, 7), (8, 10)]),
+    (5, 6, 4, [(5, 5), (6, 6)]),
+])
+def test_split_block_range(start_block, end_block, parts, expected_ranges):
+    assert list(split_block_range(start_block, end_block, parts)) == expected_ranges
+
+
+def test_streamer_raises_when_start_block_and_file_exist(tmpdir):
+    last_synced_block_file = tmpdir.join('last_synced_block.txt')
+    last_synced_block_file.write('10\n')
+
+    with pytest.raises(ValueError):
+        Streamer(
+            last_synced_block_file=str(last_synced_block_file),
+            start_block=5)